@@ -1,25 +1,36 @@
 # analysis.py
 from __future__ import annotations
+import atexit
 import math
+import multiprocessing
+import os
 import re
-from typing import Dict, List, Tuple
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 # --- Scraper (MyMuse/Okendo tuned, with JS fallback) ---
+from cachetools import TTLCache
 from selenium_scraper import scrape_reviews
 
+# Recent scrapes by URL (1h); avoids re-running Selenium on resubmits
+_SCRAPE_CACHE: TTLCache = TTLCache(maxsize=256, ttl=3600)
+_SCRAPE_LOCK = threading.Lock()
+
 # --- NLP / ML ---
+import numpy as np
 from nltk.sentiment import SentimentIntensityAnalyzer
 import nltk
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 
 
 # -------------------- Utils --------------------
 
+_WS = re.compile(r"\s+")
+
 def _clean(t: str) -> str:
-    t = (t or "").strip()
-    t = re.sub(r"\s+", " ", t)
-    return t
+    return _WS.sub(" ", t or "").strip()
 
 def _ensure_vader() -> None:
     """
@@ -30,6 +41,76 @@ def _ensure_vader() -> None:
     except LookupError:
         nltk.download("vader_lexicon", quiet=True)
 
+@lru_cache(maxsize=1)
+def _get_sia() -> SentimentIntensityAnalyzer:
+    """
+    Build the VADER analyzer once per process (parsing the lexicon is slow).
+    """
+    _ensure_vader()
+    return SentimentIntensityAnalyzer()
+
+
+# Above this many reviews, VADER scoring is spread over worker processes
+_PARALLEL_MIN = 64
+
+# One long-lived pool, started on first use. It comes from a forkserver so
+# workers are never forked from the threaded web process (driver, DB and
+# HTTP pool locks); the server preloads this module once for them.
+# None = not started yet, False = disabled after a failure.
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def _usable_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))  # respects container CPU affinity
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def _init_sia() -> None:
+    _get_sia()
+
+def _score_one(r: str) -> float:
+    return _get_sia().polarity_scores(r)["compound"]
+
+def _get_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload([__name__])
+            _POOL = ctx.Pool(min(4, _usable_cpus()), initializer=_init_sia)
+            atexit.register(_POOL.terminate)
+        return _POOL or None
+
+def _disable_pool() -> None:
+    """
+    Tear down a failed pool (and its queued tasks) and score serially for
+    the rest of the process instead of stalling every later call.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, False
+    if pool:
+        pool.terminate()
+
+def _score_parallel(reviews: List[str]) -> Optional[List[float]]:
+    """
+    Score reviews on the shared worker pool (bypasses the GIL for VADER).
+    Returns None with fewer than 2 usable CPUs, without forkserver
+    (e.g., Windows), or once the pool has failed or timed out.
+    """
+    if _usable_cpus() < 2 or "forkserver" not in multiprocessing.get_all_start_methods():
+        return None
+    try:
+        pool = _get_pool()
+        if pool is None:
+            return None
+        # Bounded wait: workers that can't start would otherwise block forever
+        return pool.map_async(_score_one, reviews, chunksize=32).get(timeout=30)
+    except (OSError, multiprocessing.TimeoutError):
+        _disable_pool()
+        return None
+
 
 # -------------------- Public API --------------------
 
@@ -37,104 +118,151 @@ def scrape(url: str, timeout: int = 20) -> List[str]:
     """
     Return a list of raw review texts from a MyMuse product page.
     Uses fast HTML first; falls back to Selenium if needed.
+    Non-empty results are cached per URL for an hour.
+    """
+    with _SCRAPE_LOCK:
+        cached = _SCRAPE_CACHE.get(url)
+    if cached is not None:
+        return list(cached)
+
+    revs = scrape_reviews(url, timeout=timeout)
+    if revs:
+        with _SCRAPE_LOCK:
+            _SCRAPE_CACHE[url] = list(revs)
+    return revs
+
+
+def prepare(reviews: List[str]) -> List[str]:
+    """
+    Clean reviews and drop very short ones (< 5 words), once per request.
+    senti(), tfidf() and clusters() expect this output.
     """
-    return scrape_reviews(url, timeout=timeout)
+    return [_clean(r) for r in (reviews or []) if r and len(r.split()) >= 5]
 
 
-def senti(reviews: List[str]) -> Dict[str, object]:
+def senti(docs: List[str]) -> Dict[str, object]:
     """
-    Simple sentiment summary using VADER.
+    Simple sentiment summary using VADER over prepared docs (see prepare()).
     Returns: {"avg": float, "distribution": {"pos": x, "neu": y, "neg": z}}
     """
-    reviews = [_clean(r) for r in (reviews or []) if r and len(r.split()) >= 5]
+    reviews = docs or []
     if not reviews:
         return {"avg": 0.0, "distribution": {"pos": 0, "neu": 0, "neg": 0}}
 
-    _ensure_vader()
-    sia = SentimentIntensityAnalyzer()
-
-    total = 0.0
-    dist = {"pos": 0, "neu": 0, "neg": 0}
-    for r in reviews:
-        s = sia.polarity_scores(r)["compound"]
-        total += s
-        if s >= 0.05:
-            dist["pos"] += 1
-        elif s <= -0.05:
-            dist["neg"] += 1
-        else:
-            dist["neu"] += 1
-
-    avg = total / max(len(reviews), 1)
+    compounds = _score_parallel(reviews) if len(reviews) > _PARALLEL_MIN else None
+    if compounds is not None:
+        scores = np.asarray(compounds, dtype=np.float64)
+    else:
+        # Score the whole batch first with the bound method hoisted to a local
+        score = _get_sia().polarity_scores
+        scores = np.fromiter((score(r)["compound"] for r in reviews), dtype=np.float64, count=len(reviews))
+
+    pos = int((scores >= 0.05).sum())
+    neg = int((scores <= -0.05).sum())
+    dist = {"pos": pos, "neu": len(scores) - pos - neg, "neg": neg}
+
+    avg = float(scores.mean())
     # Rounded for display
     return {"avg": round(avg, 3), "distribution": dist}
 
 
-def phrases(reviews: List[str], k: int = 12) -> List[str]:
+def tfidf(docs: List[str]) -> Tuple[Optional[TfidfVectorizer], object]:
     """
-    Extract top unigrams/bigrams via TF‑IDF across reviews.
-    Returns a list of key phrases for prompting / display.
+    Fit a single TF‑IDF model over prepared docs (see prepare()).
+    Returns (vec, X) to share between phrases() and clusters();
+    both are None when there is nothing usable to fit.
     """
-    docs = [_clean(r) for r in (reviews or []) if r and len(r.split()) >= 5]
     if not docs:
-        return []
+        return None, None
 
     vec = TfidfVectorizer(
-        max_features=2000,
+        # Shared by phrases() (was 2000) and clusters() (3000); the extra
+        # features are the rarest terms, which seldom reach the top phrases
+        max_features=3000,
         ngram_range=(1, 2),
         stop_words="english",
-        min_df=1
+        min_df=1,
+        norm="l2",  # unit rows: Euclidean KMeans ~ cosine
+        sublinear_tf=True,  # 1 + log(tf): repeated words don't dominate
+        dtype=np.float32,
     )
-    X = vec.fit_transform(docs)
-    # Average tf‑idf weight per feature across docs
-    weights = X.mean(axis=0).A1
+    try:
+        X = vec.fit_transform(docs)
+    except ValueError:
+        # Empty vocabulary (e.g., only stop words)
+        return None, None
+    return vec, X
+
+
+def phrases(vec: Optional[TfidfVectorizer], X, k: int = 12) -> List[str]:
+    """
+    Extract top unigrams/bigrams from a fitted TF‑IDF model (see tfidf()).
+    Returns a list of key phrases for prompting / display.
+    """
+    if vec is None or X is None:
+        return []
+
+    # Average tf‑idf weight per feature across docs (no dense np.matrix)
+    weights = np.asarray(X.sum(axis=0)).ravel()
+    weights /= X.shape[0]
     feats = vec.get_feature_names_out()
-    pairs = sorted(zip(feats, weights), key=lambda x: x[1], reverse=True)
-    out = [p[0] for p in pairs[:k]]
+    out = [feats[i] for i in _top_k(weights, k)]
     # remove super short tokens
     out = [p for p in out if len(p) > 2]
     return out
 
 
-def clusters(reviews: List[str], n: int = 3) -> Dict[str, List[str]]:
+def clusters(docs: List[str], vec: Optional[TfidfVectorizer], X, n: int = 3) -> Dict[str, List[str]]:
     """
-    Very light clustering of reviews using KMeans on TF‑IDF.
+    Very light clustering of reviews using MiniBatchKMeans on TF‑IDF (see tfidf()).
     Returns a dict: {"Theme 1": [bullets...], ...}
     Each theme has a couple of representative phrases/summaries.
     """
-    docs = [_clean(r) for r in (reviews or []) if r and len(r.split()) >= 5]
     if not docs:
         return {"Themes (sample reviews)": []}
 
     # Bound number of clusters
     n = max(1, min(n, len(docs)))
-    if n == 1:
+    if n == 1 or vec is None or X is None:
         # Just return a couple of compact bullets from the corpus
         return {"Theme 1": _compact_bullets(docs)}
 
-    vec = TfidfVectorizer(max_features=3000, ngram_range=(1, 2), stop_words="english")
-    X = vec.fit_transform(docs)
-
-    # Handle small corpora robustly
-    try:
-        km = KMeans(n_clusters=n, n_init=10, random_state=42)
-        km.fit(X)
-    except Exception:
-        # If KMeans fails (e.g., sparse tiny data), fallback to one theme
-        return {"Theme 1": _compact_bullets(docs)}
+    # Identical docs give identical rows. With fewer than ~2n distinct rows
+    # KMeans ends up with empty/degenerate clusters, so group those directly:
+    # duplicates together, distinct docs in consecutive runs.
+    uniq: Dict[str, int] = {}
+    uid = np.fromiter((uniq.setdefault(d, len(uniq)) for d in docs), dtype=np.intp, count=len(docs))
+    if len(uniq) < 2 * n:
+        n = min(n, len(uniq))
+        if n == 1:
+            return {"Theme 1": _compact_bullets(list(uniq))}
+        labels = uid * n // len(uniq)
+        centers = np.vstack([np.asarray(X[labels == i].mean(axis=0)) for i in range(n)])
+    else:
+        # Handle small corpora robustly
+        try:
+            km = MiniBatchKMeans(n_clusters=n, n_init=3, batch_size=256, random_state=42)
+            km.fit(X)
+        except Exception:
+            # If clustering fails (e.g., sparse tiny data), fallback to one theme
+            return {"Theme 1": _compact_bullets(docs)}
+        labels, centers = km.labels_, km.cluster_centers_
 
     terms = vec.get_feature_names_out()
-    order_centroids = km.cluster_centers_.argsort()[:, ::-1]
+
+    # Group doc indices by label in one pass (stable: keeps doc order)
+    order = np.argsort(labels, kind="stable")
+    bounds = np.searchsorted(labels[order], np.arange(n + 1))
 
     themes: Dict[str, List[str]] = {}
     for i in range(n):
         label = f"Theme {i+1}"
         # top terms per cluster
-        top_terms = [terms[idx] for idx in order_centroids[i, :6]]
+        top_terms = [terms[idx] for idx in _top_k(centers[i], 6)]
         summary = " • ".join(top_terms[:3])
         # pick one representative review (first in cluster)
-        reps = [docs[j] for j in range(len(docs)) if km.labels_[j] == i]
-        bullet = reps[0] if reps else ""
+        members = order[bounds[i]:bounds[i + 1]]
+        bullet = docs[members[0]] if len(members) else ""
         themes[label] = [summary, _shorten(bullet)]
     return themes
 
@@ -155,3 +283,15 @@ def _compact_bullets(docs: List[str]) -> List[str]:
     for r in docs[:3]:
         out.append(_shorten(r, 20))
     return out
+
+def _top_k(weights, k: int):
+    """
+    Indices of the k largest weights, highest first; ties go to the lower
+    index (as a stable sort would). Partial selection, so O(F) + O(k log k).
+    """
+    k = min(k, weights.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    kth = -np.partition(-weights, k - 1)[k - 1]
+    cand = np.flatnonzero(weights >= kth)
+    return cand[np.lexsort((cand, -weights[cand]))][:k]
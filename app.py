@@ -1,14 +1,20 @@
 import os
-import json
+import threading
 import time
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import orjson
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from dotenv import load_dotenv
 
 from config import Config
 from extensions import db, login_manager
 from models import User
-from analysis import scrape, senti, phrases, clusters
+from analysis import scrape, prepare, senti, tfidf, phrases, clusters
 from generate import build_prompt, package_json
 
 # Load env vars
@@ -46,6 +52,18 @@ with app.app_context():
 # Ensure data folder exists
 os.makedirs("data", exist_ok=True)
 
+# Recently written result files, served from memory on download
+_RESULTS: "OrderedDict[str, bytes]" = OrderedDict()
+_RESULTS_MAX = 64
+_RESULTS_LOCK = threading.Lock()
+
+# Scrape + analysis + LLM run off the request thread; the browser polls
+# /status/<job_id>. Jobs live in this process's memory (single worker).
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+JOBS: "OrderedDict[str, dict]" = OrderedDict()
+JOBS_MAX = 256
+JOBS_LOCK = threading.Lock()
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -90,6 +108,11 @@ def login():
             flash("Invalid credentials", "danger")
             return redirect(url_for("login"))
 
+        # Upgrade legacy/outdated hashes now that we have the plaintext
+        if u.needs_rehash():
+            u.set_password(pw)
+            db.session.commit()
+
         login_user(u)
         return redirect(url_for("dashboard"))
 
@@ -101,14 +124,17 @@ def logout():
     logout_user()
     return redirect(url_for("home"))
 
-@app.route("/dashboard", methods=["GET", "POST"])
-@login_required
-def dashboard():
-    if request.method == "POST":
-        product_name = (request.form.get("product_name") or "MyMuse Product").strip()
-        url = (request.form.get("url") or "").strip()
-        pasted = (request.form.get("pasted") or "").strip()
-
+def run_pipeline(job_id: str, product_name: str, url: str, pasted: str) -> None:
+    """
+    Scrape → analyze → generate for one dashboard submission.
+    Runs on EXECUTOR; user-facing notes go to the job (no request context here).
+    """
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+    if job is None:
+        return
+    notes = job["messages"]
+    try:
         reviews = []
         error = None
 
@@ -122,7 +148,7 @@ def dashboard():
             reviews = [r.strip() for r in pasted.split("\n") if len(r.split()) > 4]
 
         if not reviews and not pasted and error:
-            flash(error, "warning")
+            notes.append(("warning", error))
 
         if not reviews:
             demo_reviews = [
@@ -134,11 +160,14 @@ def dashboard():
                 "Customer support was helpful and shipping was quick."
             ]
             reviews = demo_reviews
-            flash("No reviews scraped/pasted — using demo reviews.", "info")
+            notes.append(("info", "No reviews scraped/pasted — using demo reviews."))
 
-        sentiment = senti(reviews)
-        key_phrases = phrases(reviews, k=10)
-        theme_groups = clusters(reviews, n=3)
+        # Clean once, then one TF‑IDF fit shared by phrases + clusters
+        docs = prepare(reviews)
+        sentiment = senti(docs)
+        vec, X = tfidf(docs)
+        key_phrases = phrases(vec, X, k=10)
+        theme_groups = clusters(docs, vec, X, n=3)
 
         prompt = build_prompt(product_name, theme_groups, key_phrases, sentiment)
         ai_copy = ""
@@ -148,25 +177,84 @@ def dashboard():
             try:
                 ai_copy = generate_with_groq(prompt)
             except Exception as e:
-                flash(f"Groq generation failed: {e}", "warning")
+                notes.append(("warning", f"Groq generation failed: {e}"))
         else:
-            flash("AI generation is disabled (no Groq key).", "info")
+            notes.append(("info", "AI generation is disabled (no Groq key)."))
 
         data = package_json(product_name, len(reviews), sentiment, key_phrases, theme_groups, prompt, ai_copy)
         ts = int(time.time())
-        fname = f"output_{ts}.json"
+        fname = f"output_{ts}_{job_id[:8]}.json"
         path = os.path.join("data", fname)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        body = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        with open(path, "wb") as f:
+            f.write(body)
+        with _RESULTS_LOCK:
+            _RESULTS[fname] = body
+            while len(_RESULTS) > _RESULTS_MAX:
+                _RESULTS.popitem(last=False)
+
+        job.update(data=data, file=fname, status="done")
+    except Exception as e:
+        notes.append(("danger", f"Generation failed: {e}"))
+        job["status"] = "error"
+
+def _get_job(job_id: str) -> dict:
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+    if job is None or job["user_id"] != current_user.id:
+        abort(404)
+    return job
+
+@app.route("/dashboard", methods=["GET", "POST"])
+@login_required
+def dashboard():
+    if request.method == "POST":
+        product_name = (request.form.get("product_name") or "MyMuse Product").strip()
+        url = (request.form.get("url") or "").strip()
+        pasted = (request.form.get("pasted") or "").strip()
 
-        return render_template("main/result.html", data=data, file=fname)
+        job_id = uuid.uuid4().hex
+        with JOBS_LOCK:
+            JOBS[job_id] = {"user_id": current_user.id, "status": "running", "messages": [], "data": None, "file": None}
+            # Evict oldest finished jobs; never drop one that is still running
+            excess = len(JOBS) - JOBS_MAX
+            if excess > 0:
+                for old_id in [k for k, j in JOBS.items() if j["status"] != "running"][:excess]:
+                    del JOBS[old_id]
+        EXECUTOR.submit(run_pipeline, job_id, product_name, url, pasted)
+
+        return redirect(url_for("job", job_id=job_id))
 
     return render_template("main/dashboard.html")
 
+@app.route("/job/<job_id>")
+@login_required
+def job(job_id):
+    j = _get_job(job_id)
+    if j["status"] == "running":
+        return render_template("main/pending.html", job_id=job_id)
+
+    for category, msg in j["messages"]:
+        flash(msg, category)
+    j["messages"] = []
+    if j["status"] == "error":
+        return redirect(url_for("dashboard"))
+    return render_template("main/result.html", data=j["data"], file=j["file"])
+
+@app.route("/status/<job_id>")
+@login_required
+def status(job_id):
+    return jsonify({"status": _get_job(job_id)["status"]})
+
 @app.route("/download/<fname>")
 @login_required
 def download(fname):
-    path = os.path.join("data", os.path.basename(fname))
+    fname = os.path.basename(fname)
+    with _RESULTS_LOCK:
+        body = _RESULTS.get(fname)
+    if body is not None:
+        return send_file(BytesIO(body), as_attachment=True, mimetype="application/json", download_name=fname)
+    path = os.path.join("data", fname)
     if os.path.exists(path):
         return send_file(path, as_attachment=True, mimetype="application/json", download_name=fname)
     flash("File not found", "danger")
@@ -1,13 +1,26 @@
 
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from flask_login import UserMixin
 from extensions import db
 
+# Low-memory argon2id profile; one hasher per process
+_PH = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(150), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    def set_password(self, password): self.password_hash = generate_password_hash(password)
-    def check_password(self, password): return check_password_hash(self.password_hash, password)
+    def set_password(self, password): self.password_hash = _PH.hash(password)
+    def check_password(self, password):
+        if not self.password_hash.startswith("$argon2"):
+            # Legacy werkzeug (pbkdf2/scrypt) hash
+            return check_password_hash(self.password_hash, password)
+        try:
+            return _PH.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    def needs_rehash(self): return not self.password_hash.startswith("$argon2") or _PH.check_needs_rehash(self.password_hash)
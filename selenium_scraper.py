@@ -1,61 +1,74 @@
 # selenium_scraper.py
 from __future__ import annotations
-import os, re, time
+import atexit, os, re, threading, time
 from typing import List
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 
 UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
       "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
-HEADERS = {"User-Agent": UA}
+HEADERS = {"User-Agent": UA, "Accept-Encoding": "gzip, deflate, br"}
+
+# Shared session: keep-alive connection pool across scrapes. Retries are
+# connect-only (read=0) so a slow shop can't multiply the read timeout.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=10, pool_maxsize=10,
+                       max_retries=Retry(total=2, read=0, backoff_factor=0.3))
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+_WS = re.compile(r"\s+")
 
 # -------------------- Helpers --------------------
 
 def _dedup(texts: List[str], min_words: int = 5, key_len: int = 200) -> List[str]:
     out, seen = [], set()
     for t in texts:
-        t = re.sub(r"\s+", " ", (t or "")).strip()
+        t = _WS.sub(" ", t or "").strip()
         if len(t.split()) < min_words:
             continue
-        k = t.lower()[:key_len]
+        k = hash(t.lower()[:key_len])  # store 64-bit ints, not key strings
         if k not in seen:
             seen.add(k); out.append(t)
     return out
 
-def _extract_from_html(html: str) -> List[str]:
-    soup = BeautifulSoup(html, "html.parser")
-    hits: List[str] = []
+# Class/attribute fragments every selector below contains; cheap substring
+# check so pages without any review widget markup skip DOM building.
+_REVIEW_MARKERS = ("okeReviews", "data-oke-review-text", "jdgm-rev",
+                   "spr-review", "stamped-review", "yotpo-")
 
+# All review-text selectors as one selector group, so the tree is walked once
+_REVIEW_SELECTOR = ", ".join([
     # Okendo (common on MyMuse)
-    for sel in [
-        ".okeReviews-review-body",
-        ".okeReviews-review-content",
-        ".okeReviewsReviewContent",
-        "[data-oke-review-text]",
-    ]:
-        for el in soup.select(sel):
-            txt = el.get_text(" ", strip=True)
-            if len(txt.split()) >= 5:
-                hits.append(txt)
-
+    ".okeReviews-review-body",
+    ".okeReviews-review-content",
+    ".okeReviewsReviewContent",
+    "[data-oke-review-text]",
     # Generic fallbacks (Judge.me / Shopify Reviews / Stamped / Yotpo)
-    for sel in [
-        ".jdgm-rev__body, .jdgm-rev__content, .jdgm-rev__title",
-        ".spr-review-content, .spr-review-body, .spr-review-header-title",
-        ".stamped-review-message, .stamped-review-content",
-        ".yotpo-review, .yotpo-main .content-review, .yotpo-review-content",
-    ]:
-        for el in soup.select(sel):
-            txt = el.get_text(" ", strip=True)
-            if len(txt.split()) >= 5:
-                hits.append(txt)
+    ".jdgm-rev__body, .jdgm-rev__content, .jdgm-rev__title",
+    ".spr-review-content, .spr-review-body, .spr-review-header-title",
+    ".stamped-review-message, .stamped-review-content",
+    ".yotpo-review, .yotpo-main .content-review, .yotpo-review-content",
+])
+
+def _extract_from_html(html: str) -> List[str]:
+    if not html or not any(m in html for m in _REVIEW_MARKERS):
+        return []
+    soup = BeautifulSoup(html, "lxml")
+    hits: List[str] = []
+
+    for el in soup.select(_REVIEW_SELECTOR):
+        txt = el.get_text(" ", strip=True)
+        if len(txt.split()) >= 5:
+            hits.append(txt)
 
     return _dedup(hits)
 
 # -------------------- Fast (no JS) --------------------
 
 def fetch_static_reviews(url: str, timeout: int = 15) -> List[str]:
-    r = requests.get(url, headers=HEADERS, timeout=timeout)
+    r = _SESSION.get(url, headers=HEADERS, timeout=timeout)
     r.raise_for_status()
     return _extract_from_html(r.text)
 
@@ -121,11 +134,16 @@ return Array.from(all);
     except Exception:
         return []
 
-def scrape_js_reviews(url: str, initial_wait: int = 8, clicks: int = 6) -> List[str]:
+# One warm Chrome per process; Selenium drivers are not thread-safe, so
+# a scrape holds the lock for as long as it uses the driver.
+_DRIVER = None
+_DRIVER_LOCK = threading.Lock()
+
+BLOCKED_URLS = ["*.png", "*.jpg", "*.jpeg", "*.webp", "*.gif", "*.svg",
+                "*.woff", "*.woff2", "*.ttf", "*.mp4", "*.webm"]
+
+def _build_driver():
     import undetected_chromedriver as uc
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
 
     v_env = os.environ.get("UC_VERSION_MAIN")
     v_main = int(v_env) if v_env and v_env.isdigit() else None
@@ -137,58 +155,127 @@ def scrape_js_reviews(url: str, initial_wait: int = 8, clicks: int = 6) -> List[
     opts.add_argument("--window-size=1366,1100")
     opts.add_argument("--disable-blink-features=AutomationControlled")
     opts.add_argument(f"user-agent={UA}")
+    # Reviews are text; skip images and notification prompts
+    opts.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2,
+    })
 
     driver = uc.Chrome(options=opts, version_main=v_main) if v_main else uc.Chrome(options=opts)
 
+    # Also drop heavy media/fonts at the network layer (best effort)
     try:
-        driver.get(url)
-        # Wait for any Okendo container
-        WebDriverWait(driver, 25).until(
-            EC.any_of(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "[data-oke-reviews]")),
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".okeReviews, .okeReviewsWidget"))
-            )
-        )
-        time.sleep(initial_wait)
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    except Exception:
+        pass
+    return driver
 
-        # Try to expand "Load more" several times
-        for _ in range(clicks):
-            buttons = driver.find_elements(By.CSS_SELECTOR,
-                "[data-oke-reviews-more-button], .okeReviews-more, .okeReviews-loadMore, button[aria-label*='More']"
-            )
-            clicked = False
-            for b in buttons:
-                try:
-                    if b.is_displayed() and b.is_enabled():
-                        driver.execute_script("arguments[0].scrollIntoView({block:'center'});", b)
-                        time.sleep(0.25)
-                        b.click()
-                        clicked = True
-                        time.sleep(1.8)
-                except Exception:
-                    pass
-            if not clicked:
-                break
+def _get_driver():
+    global _DRIVER
+    if _DRIVER is None:
+        _DRIVER = _build_driver()
+    return _DRIVER
 
-        # Scroll to trigger any lazy chunks
-        for _ in range(3):
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(1.6)
+def _quit_driver() -> None:
+    global _DRIVER
+    if _DRIVER is not None:
+        try:
+            _DRIVER.quit()
+        except Exception:
+            pass
+        _DRIVER = None
 
-        # Collect via JS across shadow roots
-        texts = _collect_reviews_via_js(driver)
+atexit.register(_quit_driver)
 
-        # Fallback: also parse current page source with BeautifulSoup
-        if len(texts) < 10:
-            from bs4 import BeautifulSoup
-            texts += _extract_from_html(driver.page_source)
+def _driver_alive(driver) -> bool:
+    """
+    Cheap session probe: fails only if Chrome/chromedriver is gone, not on
+    page-level errors (bad URL, DNS, refused connection).
+    """
+    try:
+        driver.window_handles
+        return True
+    except Exception:
+        return False
 
-        return _dedup(texts)[:150]
-    finally:
+def scrape_js_reviews(url: str, initial_wait: int = 8, clicks: int = 6) -> List[str]:
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    with _DRIVER_LOCK:
+        driver = _get_driver()
+        if not _driver_alive(driver):
+            # Warm browser died while idle: relaunch before using it
+            _quit_driver()
+            driver = _get_driver()
         try:
-            driver.quit()
+            driver.get(url)
+            # Wait for any Okendo container
+            WebDriverWait(driver, 25).until(
+                EC.any_of(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "[data-oke-reviews]")),
+                    EC.presence_of_element_located((By.CSS_SELECTOR, ".okeReviews, .okeReviewsWidget"))
+                )
+            )
+            time.sleep(initial_wait)
+
+            # Try to expand "Load more" several times
+            for _ in range(clicks):
+                buttons = driver.find_elements(By.CSS_SELECTOR,
+                    "[data-oke-reviews-more-button], .okeReviews-more, .okeReviews-loadMore, button[aria-label*='More']"
+                )
+                clicked = False
+                for b in buttons:
+                    try:
+                        if b.is_displayed() and b.is_enabled():
+                            driver.execute_script("arguments[0].scrollIntoView({block:'center'});", b)
+                            time.sleep(0.25)
+                            b.click()
+                            clicked = True
+                            time.sleep(1.8)
+                    except Exception:
+                        pass
+                if not clicked:
+                    break
+
+            # Scroll to trigger any lazy chunks
+            for _ in range(3):
+                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                time.sleep(1.6)
+
+            # Collect via JS across shadow roots
+            texts = _collect_reviews_via_js(driver)
+
+            # Fallback: also parse current page source with BeautifulSoup
+            if len(texts) < 10:
+                texts += _extract_from_html(driver.page_source)
+
+            return _dedup(texts)[:150]
+        except TimeoutException:
+            # No review widget showed up; the browser itself is fine
+            raise
         except Exception:
-            pass
+            # Page/navigation errors propagate with the browser kept warm;
+            # only a dead session is dropped so the next scrape relaunches
+            if not _driver_alive(driver):
+                _quit_driver()
+            raise
+        finally:
+            if _DRIVER is not None:
+                try:
+                    # Reset state for the next request instead of quitting:
+                    # clear this origin's storage and every cookie (incl.
+                    # third-party), then leave the page so its widgets/
+                    # timers/sockets don't run while idle
+                    driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+                    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                    driver.get("about:blank")
+                except Exception:
+                    if not _driver_alive(driver):
+                        _quit_driver()
 
 # -------------------- Public entry --------------------
 
@@ -4,3 +4,20 @@ function copyBlock(){
   if(!el) return;
   navigator.clipboard.writeText(el.innerText).then(()=>alert('Copied!'));
 }
+
+function pollJob(statusUrl, doneUrl, failures=0){
+  fetch(statusUrl).then(r=>{
+    const ct=r.headers.get('content-type')||'';
+    // Lost job (404), expired login (redirect to HTML) etc: stop polling and
+    // let the job page show what happened.
+    if(!r.ok || r.redirected || !ct.includes('application/json')){ window.location=doneUrl; return; }
+    return r.json().then(j=>{
+      if(j.status==='running') setTimeout(()=>pollJob(statusUrl, doneUrl), 2000);
+      else window.location=doneUrl;
+    });
+  }).catch(()=>{
+    // Network errors: retry for about a minute, then hand over to the job page
+    if(failures>=15) window.location=doneUrl;
+    else setTimeout(()=>pollJob(statusUrl, doneUrl, failures+1), 4000);
+  });
+}